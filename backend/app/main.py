@@ -1,14 +1,16 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .services.csv_extractor import ApartmentDataExtractor
 from .services.gltf_converter import PolygonToGLTFConverter
+import gc
 import os
 
 app = FastAPI(
     title="Home Craft Studio API",
     description="API for extracting apartment data and converting to GLTF/GLB format",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Enable CORS for React frontend
@@ -23,10 +25,15 @@ app.add_middleware(
 # Get CSV file path from parent directory
 CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "mds_V2_5.372k.csv")
 
-# Initialize services
+# Initialize services. This runs at import time, so with `gunicorn --preload`
+# the dataset is loaded once in the master and inherited copy-on-write by workers
 extractor = ApartmentDataExtractor(CSV_FILE_PATH)
 converter = PolygonToGLTFConverter()
 
+# Move the loaded objects out of the garbage collector's tracked generations so
+# collections in forked workers don't write to (and un-share) their pages
+gc.freeze()
+
 
 @app.get("/")
 async def root():
@@ -34,58 +41,89 @@ async def root():
     return {
         "message": "Home Craft Studio API",
         "endpoints": {
+            "/ready": "Readiness check (dataset loaded)",
             "/apartment/{apartment_id}": "Get apartment data as JSON",
-            "/apartment/{apartment_id}/glb": "Get apartment as GLB 3D model"
+            "/apartment/{apartment_id}/glb": "Get apartment as GLB 3D model",
+            "/apartment/{apartment_id}/glb?merged=true": "Get apartment as GLB with one mesh per entity subtype"
         }
     }
 
 
-def _prepare_for_json(apartment_data: dict) -> dict:
-    """Remove non-JSON-serializable fields from apartment data"""
-    json_data = apartment_data.copy()
+@app.get("/ready")
+async def ready():
+    """Readiness check; the dataset is loaded before the app starts serving"""
+    return {"status": "ready", "apartments": extractor.num_apartments}
+
+
+ENTITY_KEYS = ('areas', 'separators', 'openings')
 
-    # Remove geometry objects from each entity
-    for entity_list in [json_data.get('areas', []), json_data.get('separators', []), json_data.get('openings', [])]:
-        for entity in entity_list:
-            if 'geometry' in entity:
-                del entity['geometry']
+
+def _prepare_for_json(apartment_data: dict) -> dict:
+    """
+    Project apartment data into a JSON-serializable dict without geometry objects
+
+    The input is shared with the extractor's cache, so it is never mutated.
+    """
+    json_data = {k: v for k, v in apartment_data.items() if k not in ENTITY_KEYS}
+    for key in ENTITY_KEYS:
+        json_data[key] = [
+            {k: v for k, v in entity.items() if k != 'geometry'}
+            for entity in apartment_data.get(key, [])
+        ]
 
     return json_data
 
 
 @app.get("/apartment/{apartment_id}")
-async def get_apartment_data(apartment_id: str):
+def get_apartment_data(apartment_id: str):
     """Get apartment data by ID"""
     try:
         apartment_data = extractor.get_apartment_by_id(apartment_id)
         if not apartment_data:
             raise HTTPException(status_code=404, detail=f"Apartment with ID {apartment_id} not found")
 
-        # Prepare data for JSON serialization
+        # Prepare data for JSON serialization; returning the response directly
+        # lets orjson serialize the NumPy coordinate arrays without jsonable_encoder
         json_data = _prepare_for_json(apartment_data)
-        return json_data
+        return ORJSONResponse(json_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.api_route("/apartment/{apartment_id}/glb", methods=["GET", "HEAD"])
-async def get_apartment_glb(apartment_id: str):
-    """Get apartment as GLB 3D model"""
-    try:
-        # Extract apartment data
-        apartment_data = extractor.get_apartment_by_id(apartment_id)
-        if not apartment_data:
-            raise HTTPException(status_code=404, detail=f"Apartment with ID {apartment_id} not found")
+GLB_CHUNK_SIZE = 64 * 1024
+
 
-        # Convert to GLB
-        glb_bytes = converter.convert_apartment_to_glb(apartment_data)
+async def _iter_chunks(data: bytes, chunk_size: int = GLB_CHUNK_SIZE):
+    """Yield zero-copy slices of data for a streaming response"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
 
-        # Return GLB file
-        return Response(
-            content=glb_bytes,
+
+@app.api_route("/apartment/{apartment_id}/glb", methods=["GET", "HEAD"])
+def get_apartment_glb(apartment_id: str, merged: bool = False):
+    """Get apartment as GLB 3D model (merged=true combines meshes per entity subtype)"""
+    try:
+        cache_key = (apartment_id, merged)
+        glb_bytes = converter.glb_cache.get(cache_key)
+        if glb_bytes is None:
+            # Extract apartment data
+            apartment_data = extractor.get_apartment_by_id(apartment_id)
+            if not apartment_data:
+                raise HTTPException(status_code=404, detail=f"Apartment with ID {apartment_id} not found")
+
+            # Convert to GLB
+            glb_bytes = converter.convert_apartment_to_glb(apartment_data, merge_meshes=merged)
+            converter.glb_cache.put(cache_key, glb_bytes)
+
+        # Stream GLB file straight from the cached bytes
+        return StreamingResponse(
+            _iter_chunks(glb_bytes),
             media_type="model/gltf-binary",
             headers={
-                "Content-Disposition": f"inline; filename=apartment_{apartment_id}.glb"
+                "Content-Disposition": f"inline; filename=apartment_{apartment_id}.glb",
+                "Content-Length": str(len(glb_bytes)),
+                "Cache-Control": "public, max-age=3600"
             }
         )
     except Exception as e:
@@ -93,7 +131,7 @@ async def get_apartment_glb(apartment_id: str):
 
 
 @app.get("/apartment/{apartment_id}/polygons")
-async def get_apartment_polygons(apartment_id: str):
+def get_apartment_polygons(apartment_id: str):
     """Get apartment as 2D polygon data (for frontend extrusion)"""
     try:
         apartment_data = extractor.get_apartment_by_id(apartment_id)
@@ -138,7 +176,7 @@ async def get_apartment_polygons(apartment_id: str):
                 "coordinates": opening.get('coordinates', [])
             })
 
-        return result
+        return ORJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,75 +1,230 @@
+import numpy as np
 import pandas as pd
-from shapely import wkt
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
 from shapely.geometry import Polygon
 from typing import List, Dict, Optional
 import logging
+import os
+
+from .lru_cache import LRUCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns read from the CSV and their storage types; everything else is skipped
+CSV_DTYPES = {
+    'apartment_id': 'string',
+    'entity_type': 'category',
+    'entity_subtype': 'category',
+    'geom': 'object',
+    'elevation': 'float64',
+    'height': 'float64',
+    'zoning': 'category',
+    'roomtype': 'category',
+    'area_id': 'float64',
+    'unit_id': 'float64',
+}
+
+# Text columns whose missing values are exposed as empty strings
+TEXT_COLUMNS = ['zoning', 'roomtype']
+
+# Numeric columns whose missing values are exposed as None
+ID_COLUMNS = ['area_id', 'unit_id']
+
+# Values used for missing elevation and height
+DEFAULT_ELEVATION = 0.0
+DEFAULT_HEIGHT = 2.6
+
+
+def read_apartment_csv(csv_file_path: str) -> pd.DataFrame:
+    """Read the needed columns of the apartment CSV with their storage types"""
+    return pd.read_csv(
+        csv_file_path,
+        usecols=lambda column: column in CSV_DTYPES,
+        dtype=CSV_DTYPES,
+    )
+
+
+def dataset_path_for(csv_file_path: str, extension: str) -> str:
+    """Path of a converted copy (.feather or .parquet) that is preferred over the CSV"""
+    return os.path.splitext(csv_file_path)[0] + extension
+
 
 class ApartmentDataExtractor:
     """Extract apartment data from CSV file"""
 
-    def __init__(self, csv_file_path: str):
+    def __init__(self, csv_file_path: str, cache_size: int = 512):
         self.csv_file_path = csv_file_path
         self.df = None
+        self._groups: Dict[str, np.ndarray] = {}
+        self._all_ids: List[str] = []
+        self._apartment_cache = LRUCache(maxsize=cache_size)
         self._load_data()
 
     def _load_data(self):
-        """Load CSV data into pandas DataFrame"""
+        """
+        Load apartment data into pandas DataFrame
+
+        Prefers a memory-mapped Feather copy, then a Parquet copy, then the CSV.
+        """
         try:
-            logger.info(f"Loading CSV file from {self.csv_file_path}")
-            self.df = pd.read_csv(self.csv_file_path)
+            feather_path = dataset_path_for(self.csv_file_path, '.feather')
+            parquet_path = dataset_path_for(self.csv_file_path, '.parquet')
+            if os.path.exists(feather_path):
+                logger.info(f"Memory-mapping Feather file from {feather_path}")
+                self.df = self._read_feather(feather_path)
+            elif os.path.exists(parquet_path):
+                logger.info(f"Loading Parquet file from {parquet_path}")
+                columns = [c for c in pq.read_schema(parquet_path).names if c in CSV_DTYPES]
+                self.df = pd.read_parquet(parquet_path, columns=columns)
+            else:
+                logger.info(f"Loading CSV file from {self.csv_file_path}")
+                self.df = read_apartment_csv(self.csv_file_path)
             logger.info(f"Loaded {len(self.df)} rows")
+            self._normalize_columns()
+            self._parse_geometries()
+            self._build_index()
         except Exception as e:
-            logger.error(f"Error loading CSV: {e}")
+            logger.error(f"Error loading apartment data: {e}")
             raise
 
+    @staticmethod
+    def _read_feather(feather_path: str) -> pd.DataFrame:
+        """
+        Read an uncompressed Feather (Arrow IPC) file through a memory map
+
+        Numeric columns without missing values stay backed by the mapped file,
+        so worker processes opening the same file share those pages. The map
+        is intentionally left open for as long as the DataFrame references it.
+        """
+        table = pa.ipc.open_file(pa.memory_map(feather_path, 'r')).read_all()
+        table = table.select([c for c in table.column_names if c in CSV_DTYPES])
+        return table.to_pandas(split_blocks=True)
+
+    def _normalize_columns(self):
+        """
+        Make sure optional columns exist and fill missing values once at load
+        time, so per-apartment lookups can index columns directly
+        """
+        for column in TEXT_COLUMNS:
+            if column not in self.df:
+                self.df[column] = pd.Series('', index=self.df.index, dtype='category')
+                continue
+            series = self.df[column]
+            if '' not in series.cat.categories:
+                series = series.cat.add_categories([''])
+            self.df[column] = series.fillna('')
+
+        for column in ID_COLUMNS:
+            if column not in self.df:
+                self.df[column] = np.nan
+
+        # Only fill when needed: fillna copies the column, which would detach
+        # it from a memory-mapped Feather file
+        for column, default in [('elevation', DEFAULT_ELEVATION), ('height', DEFAULT_HEIGHT)]:
+            if self.df[column].hasnans:
+                self.df[column] = self.df[column].fillna(default)
+
+    def _parse_geometries(self):
+        """Parse all WKT strings in one vectorized call and drop the raw column"""
+        # from_wkt accepts None but not NaN for missing values
+        wkt_strings = self.df['geom'].to_numpy(dtype=object, copy=True)
+        wkt_strings[pd.isna(wkt_strings)] = None
+
+        self.df['geometry'] = shapely.from_wkt(wkt_strings, on_invalid='ignore')
+        # del removes the column without consolidating (and copying) the other blocks
+        del self.df['geom']
+
+        num_invalid = int(self.df['geometry'].isna().sum())
+        if num_invalid:
+            logger.warning(f"Skipping {num_invalid} rows with missing or invalid WKT geometry")
+
+    def _build_index(self):
+        """Index row positions by apartment_id so lookups avoid a full scan"""
+        self._groups = self.df.groupby('apartment_id', sort=False).indices
+        self._all_ids = list(self._groups.keys())
+        logger.info(f"Indexed {len(self._all_ids)} apartments")
+
     def get_apartment_by_id(self, apartment_id: str) -> Optional[Dict]:
         """
         Get all data for a specific apartment ID
         Returns apartment data with parsed geometries
+
+        Results are kept in an LRU cache, so callers must treat the
+        returned dict (and the entity dicts inside it) as read-only.
         """
         if self.df is None:
             raise ValueError("Data not loaded")
 
-        # Filter by apartment_id
-        apartment_df = self.df[self.df['apartment_id'] == apartment_id]
+        apartment_data = self._apartment_cache.get(apartment_id)
+        if apartment_data is not None:
+            return apartment_data
+
+        apartment_data = self._parse_apartment(apartment_id)
+        if apartment_data is None:
+            return None
+
+        self._apartment_cache.put(apartment_id, apartment_data)
+        return apartment_data
+
+    @staticmethod
+    def _ids_or_none(series: pd.Series) -> List[Optional[float]]:
+        """Convert an id column to a list of floats with None for missing values"""
+        return series.astype(object).where(series.notna(), None).tolist()
 
-        if apartment_df.empty:
+    def _parse_apartment(self, apartment_id: str) -> Optional[Dict]:
+        """Build apartment data from the DataFrame rows and their pre-parsed geometries"""
+        # Look up row positions for this apartment_id
+        row_positions = self._groups.get(apartment_id)
+        if row_positions is None:
             return None
 
+        apartment_df = self.df.take(row_positions)
+
         # Group data by entity type
         areas = []
         separators = []
         openings = []
+        buckets = {'area': areas, 'separator': separators, 'opening': openings}
 
-        for _, row in apartment_df.iterrows():
-            try:
-                # Parse WKT geometry
-                geom = wkt.loads(row['geom'])
+        # Pull each column out once (as native Python values) instead of
+        # building a Series per row
+        geoms = apartment_df['geometry'].to_numpy()
+        entity_types = apartment_df['entity_type'].tolist()
+        entity_subtypes = apartment_df['entity_subtype'].tolist()
+        elevations = apartment_df['elevation'].tolist()
+        heights = apartment_df['height'].tolist()
+        zonings = apartment_df['zoning'].tolist()
+        roomtypes = apartment_df['roomtype'].tolist()
+        area_ids = self._ids_or_none(apartment_df['area_id'])
+        unit_ids = self._ids_or_none(apartment_df['unit_id'])
 
+        for i in range(len(apartment_df)):
+            bucket = buckets.get(entity_types[i])
+            geom = geoms[i]
+            if bucket is None or geom is None:
+                continue
+
+            try:
                 entity_data = {
-                    'entity_type': row['entity_type'],
-                    'entity_subtype': row['entity_subtype'],
+                    'entity_type': entity_types[i],
+                    'entity_subtype': entity_subtypes[i],
                     'geometry': geom,  # Keep for internal use
-                    'coordinates': list(geom.exterior.coords) if isinstance(geom, Polygon) else [],
-                    'elevation': float(row['elevation']) if pd.notna(row['elevation']) else 0.0,
-                    'height': float(row['height']) if pd.notna(row['height']) else 2.6,
-                    'zoning': str(row.get('zoning', '')),
-                    'roomtype': str(row.get('roomtype', '')),
-                    'area_id': float(row.get('area_id')) if pd.notna(row.get('area_id')) else None,
-                    'unit_id': float(row.get('unit_id')) if pd.notna(row.get('unit_id')) else None,
+                    'coordinates': (
+                        np.asarray(geom.exterior.coords, dtype=np.float32)
+                        if isinstance(geom, Polygon) else np.empty((0, 2), dtype=np.float32)
+                    ),
+                    'elevation': elevations[i],
+                    'height': heights[i],
+                    'zoning': zonings[i],
+                    'roomtype': roomtypes[i],
+                    'area_id': area_ids[i],
+                    'unit_id': unit_ids[i],
                 }
 
-                # Categorize by entity type
-                if row['entity_type'] == 'area':
-                    areas.append(entity_data)
-                elif row['entity_type'] == 'separator':
-                    separators.append(entity_data)
-                elif row['entity_type'] == 'opening':
-                    openings.append(entity_data)
+                bucket.append(entity_data)
 
             except Exception as e:
                 logger.warning(f"Error parsing row: {e}")
@@ -83,14 +238,18 @@ class ApartmentDataExtractor:
             'total_elements': len(areas) + len(separators) + len(openings),
         }
 
+    @property
+    def num_apartments(self) -> int:
+        """Number of distinct apartment IDs in the dataset"""
+        return len(self._all_ids)
+
     def get_all_apartment_ids(self, limit: int = 100) -> List[str]:
         """Get list of unique apartment IDs"""
         if self.df is None:
             raise ValueError("Data not loaded")
 
-        # Filter out NaN values and convert to list
-        apartment_ids = self.df['apartment_id'].dropna().unique().tolist()
-        return apartment_ids[:limit]
+        # NaN ids are already excluded by the groupby index
+        return self._all_ids[:limit]
 
     def get_apartment_statistics(self, apartment_id: str) -> Optional[Dict]:
         """Get statistics for an apartment"""
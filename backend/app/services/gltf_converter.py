@@ -1,19 +1,50 @@
+import mapbox_earcut as earcut
 import numpy as np
 import trimesh
+from trimesh.visual import TextureVisuals
+from trimesh.visual.material import PBRMaterial
 from shapely.geometry import Polygon
-from typing import List, Dict
+from shapely.geometry.polygon import orient
+from typing import List, Dict, Optional, Tuple
 import logging
 import io
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .lru_cache import LRUCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Apartment data keys and the mesh name prefix used for their entities
+ENTITY_GROUPS = [
+    ('areas', 'area'),
+    ('separators', 'separator'),
+    ('openings', 'opening'),
+]
+
 
 class PolygonToGLTFConverter:
     """Convert polygon data to GLTF/GLB 3D models"""
 
-    def __init__(self):
-        self.color_map = {
+    def __init__(
+        self,
+        glb_cache_size: int = 128,
+        gltfpack_path: Optional[str] = None,
+        gltfpack_timeout: float = 30.0,
+        max_workers: Optional[int] = None
+    ):
+        # Worker threads for per-entity extrusion (defaults to one per CPU)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+        # Generated GLB bytes keyed by (apartment_id, merged); output is deterministic
+        self.glb_cache = LRUCache(maxsize=glb_cache_size)
+        # Optional meshoptimizer CLI used to quantize and compress exported GLBs
+        self.gltfpack_path = gltfpack_path or shutil.which('gltfpack')
+        self.gltfpack_timeout = gltfpack_timeout
+        color_map = {
             'BATHROOM': [0.7, 0.9, 1.0, 1.0],  # Light blue
             'LIVING_ROOM': [1.0, 0.9, 0.7, 1.0],  # Light yellow
             'KITCHEN': [1.0, 0.8, 0.8, 1.0],  # Light red
@@ -29,11 +60,26 @@ class PolygonToGLTFConverter:
             'ENTRANCE_DOOR': [0.4, 0.3, 0.2, 1.0],  # Dark brown
             'DEFAULT': [0.8, 0.8, 0.8, 1.0],  # Default gray
         }
+        # Allocate each color array once instead of per mesh
+        self.color_map = {key: np.asarray(color, dtype=np.float32) for key, color in color_map.items()}
+        self._default_color = self.color_map['DEFAULT']
 
     def _get_color_for_entity(self, entity_subtype: str, entity_type: str) -> np.ndarray:
         """Get color based on entity subtype or type"""
-        color = self.color_map.get(entity_subtype, self.color_map.get(entity_type, self.color_map['DEFAULT']))
-        return np.array(color)
+        color = self.color_map.get(entity_subtype)
+        if color is None:
+            color = self.color_map.get(entity_type, self._default_color)
+        return color
+
+    def _material_for_color(self, color: np.ndarray) -> PBRMaterial:
+        """Create a matte PBR material for an RGBA color, blended when translucent"""
+        rgba = np.round(np.asarray(color) * 255).astype(np.uint8)
+        return PBRMaterial(
+            baseColorFactor=rgba,
+            metallicFactor=0.0,
+            roughnessFactor=1.0,
+            alphaMode='BLEND' if rgba[3] < 255 else 'OPAQUE',
+        )
 
     def _extrude_polygon(
         self,
@@ -55,62 +101,13 @@ class PolygonToGLTFConverter:
             trimesh.Trimesh object
         """
         try:
-            # Get exterior coordinates
-            coords = list(polygon.exterior.coords)
-
-            # Remove duplicate last point if it exists
-            if coords[0] == coords[-1]:
-                coords = coords[:-1]
-
-            # Create vertices for bottom and top faces
-            vertices_2d = np.array(coords)
-            num_verts = len(vertices_2d)
-
-            # Bottom vertices (at elevation)
-            bottom_verts = np.column_stack([
-                vertices_2d[:, 0],
-                vertices_2d[:, 1],
-                np.full(num_verts, elevation)
-            ])
-
-            # Top vertices (at elevation + height)
-            top_verts = np.column_stack([
-                vertices_2d[:, 0],
-                vertices_2d[:, 1],
-                np.full(num_verts, elevation + height)
-            ])
-
-            # Combine all vertices
-            vertices = np.vstack([bottom_verts, top_verts])
-
-            # Create faces
-            faces = []
-
-            # Bottom face (reversed for correct normal)
-            bottom_face_indices = list(range(num_verts))
-            bottom_face_indices.reverse()
-            for i in range(1, num_verts - 1):
-                faces.append([0, bottom_face_indices[i + 1], bottom_face_indices[i]])
-
-            # Top face
-            for i in range(1, num_verts - 1):
-                faces.append([num_verts, num_verts + i, num_verts + i + 1])
-
-            # Side faces
-            for i in range(num_verts):
-                next_i = (i + 1) % num_verts
-                # Two triangles per side
-                faces.append([i, next_i, num_verts + i])
-                faces.append([next_i, num_verts + next_i, num_verts + i])
-
-            faces = np.array(faces)
-
-            # Create mesh
-            mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
+            # Extrude with an earcut-triangulated cap (handles concave rooms),
+            # then lift the prism to its base elevation
+            mesh = trimesh.creation.extrude_polygon(polygon, height)
+            mesh.apply_translation([0.0, 0.0, elevation])
 
-            # Set vertex colors
-            vertex_colors = np.tile(color, (len(vertices), 1))
-            mesh.visual.vertex_colors = vertex_colors
+            # Uniform color as a material instead of a per-vertex color buffer
+            mesh.visual = TextureVisuals(material=self._material_for_color(color))
 
             return mesh
 
@@ -118,123 +115,234 @@ class PolygonToGLTFConverter:
             logger.error(f"Error extruding polygon: {e}")
             raise
 
-    def convert_apartment_to_glb(self, apartment_data: Dict) -> bytes:
+    def _optimize_glb(self, glb_bytes: bytes) -> bytes:
+        """
+        Quantize and meshopt-compress a GLB with gltfpack, if it is installed
+
+        Named nodes, materials and extras are kept so meshes stay individually
+        selectable. Falls back to the unoptimized GLB if gltfpack fails.
+        """
+        if not self.gltfpack_path:
+            return glb_bytes
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_path = os.path.join(tmp_dir, 'input.glb')
+            output_path = os.path.join(tmp_dir, 'output.glb')
+            with open(input_path, 'wb') as f:
+                f.write(glb_bytes)
+
+            try:
+                subprocess.run(
+                    [self.gltfpack_path, '-i', input_path, '-o', output_path, '-cc', '-kn', '-km', '-ke'],
+                    capture_output=True,
+                    check=True,
+                    timeout=self.gltfpack_timeout,
+                )
+                with open(output_path, 'rb') as f:
+                    optimized_bytes = f.read()
+            except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                logger.warning(f"gltfpack failed, serving unoptimized GLB: {e}")
+                return glb_bytes
+
+        logger.info(f"gltfpack reduced GLB from {len(glb_bytes)} to {len(optimized_bytes)} bytes")
+        return optimized_bytes
+
+    def _build_entity_meshes(self, apartment_data: Dict) -> List[Tuple[str, trimesh.Trimesh]]:
         """
-        Convert apartment data to GLB format with separate selectable meshes
+        Extrude every polygon entity of an apartment into its own named mesh
 
         Args:
             apartment_data: Dictionary containing apartment data with areas, separators, openings
 
         Returns:
-            GLB file as bytes
+            List of (mesh_name, mesh) tuples in areas, separators, openings order
         """
-        scene = trimesh.Scene()
-        mesh_counter = 0
-
-        try:
-            # Process areas (rooms)
-            for idx, area in enumerate(apartment_data.get('areas', [])):
-                if not isinstance(area['geometry'], Polygon):
+        # Name entities up front so naming stays deterministic
+        named_entities = []
+        for group_key, name_prefix in ENTITY_GROUPS:
+            for idx, entity in enumerate(apartment_data.get(group_key, [])):
+                if not isinstance(entity['geometry'], Polygon):
                     continue
 
-                color = self._get_color_for_entity(area['entity_subtype'], area['entity_type'])
-                mesh = self._extrude_polygon(
-                    area['geometry'],
-                    area['elevation'],
-                    area['height'],
-                    color
-                )
+                # Create unique name (areas are identified by area_id, the rest by counter)
+                mesh_counter = len(named_entities)
+                suffix = entity.get('area_id', mesh_counter) if group_key == 'areas' else mesh_counter
+                mesh_name = f"{name_prefix}_{idx}_{entity.get('entity_subtype', 'unknown')}_{suffix}"
+                named_entities.append((mesh_name, entity))
+
+        # Extrusions are independent, so run them on the thread pool
+        meshes = self._executor.map(self._extrude_entity, [entity for _, entity in named_entities])
+
+        return [(mesh_name, mesh) for (mesh_name, _), mesh in zip(named_entities, meshes)]
+
+    def _extrude_entity(self, entity: Dict) -> trimesh.Trimesh:
+        """Extrude a single entity and attach its metadata to the mesh"""
+        color = self._get_color_for_entity(entity['entity_subtype'], entity['entity_type'])
+        mesh = self._extrude_polygon(
+            entity['geometry'],
+            entity['elevation'],
+            entity['height'],
+            color
+        )
+
+        # Add metadata to mesh
+        mesh.metadata = {
+            'entity_type': entity.get('entity_type', ''),
+            'entity_subtype': entity.get('entity_subtype', ''),
+            'roomtype': entity.get('roomtype', ''),
+            'zoning': entity.get('zoning', ''),
+            'elevation': entity.get('elevation', 0.0),
+            'height': entity.get('height', 2.6),
+            'area_id': entity.get('area_id'),
+            'unit_id': entity.get('unit_id'),
+            # Full-precision coordinates from the geometry; the float32 arrays
+            # used for JSON responses would print as long float64 expansions here
+            'coordinates': np.asarray(entity['geometry'].exterior.coords).tolist()
+        }
 
-                # Add metadata to mesh
-                mesh.metadata = {
-                    'entity_type': area.get('entity_type', ''),
-                    'entity_subtype': area.get('entity_subtype', ''),
-                    'roomtype': area.get('roomtype', ''),
-                    'zoning': area.get('zoning', ''),
-                    'elevation': area.get('elevation', 0.0),
-                    'height': area.get('height', 2.6),
-                    'area_id': area.get('area_id'),
-                    'unit_id': area.get('unit_id'),
-                    'coordinates': area.get('coordinates', [])
-                }
-
-                # Create unique name
-                mesh_name = f"area_{idx}_{area.get('entity_subtype', 'unknown')}_{area.get('area_id', mesh_counter)}"
-                scene.add_geometry(mesh, node_name=mesh_name, geom_name=mesh_name)
-                mesh_counter += 1
+        return mesh
 
-            # Process separators (walls)
-            for idx, separator in enumerate(apartment_data.get('separators', [])):
-                if not isinstance(separator['geometry'], Polygon):
-                    continue
+    def _extrude_polygons_batched(
+        self,
+        polygons: List[Polygon],
+        elevations: List[float],
+        heights: List[float]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Extrude many polygons into a single vertex and face buffer
 
-                color = self._get_color_for_entity(separator['entity_subtype'], separator['entity_type'])
-                mesh = self._extrude_polygon(
-                    separator['geometry'],
-                    separator['elevation'],
-                    separator['height'],
-                    color
-                )
+        Caps are triangulated with earcut (correct for concave rooms and holes);
+        side walls for every ring of every polygon are built in one vectorized pass.
 
-                # Add metadata to mesh
-                mesh.metadata = {
-                    'entity_type': separator.get('entity_type', ''),
-                    'entity_subtype': separator.get('entity_subtype', ''),
-                    'roomtype': separator.get('roomtype', ''),
-                    'zoning': separator.get('zoning', ''),
-                    'elevation': separator.get('elevation', 0.0),
-                    'height': separator.get('height', 2.6),
-                    'area_id': separator.get('area_id'),
-                    'unit_id': separator.get('unit_id'),
-                    'coordinates': separator.get('coordinates', [])
-                }
-
-                # Create unique name
-                mesh_name = f"separator_{idx}_{separator.get('entity_subtype', 'unknown')}_{mesh_counter}"
-                scene.add_geometry(mesh, node_name=mesh_name, geom_name=mesh_name)
-                mesh_counter += 1
+        Args:
+            polygons: Shapely Polygon objects
+            elevations: Base elevation per polygon
+            heights: Extrusion height per polygon
 
-            # Process openings (doors, windows)
-            for idx, opening in enumerate(apartment_data.get('openings', [])):
-                if not isinstance(opening['geometry'], Polygon):
+        Returns:
+            (vertices, faces) arrays; all bottom vertices come first, followed
+            by the matching top vertices
+        """
+        rings = []
+        cap_faces = []
+        vertex_counts = []
+        vertex_offset = 0
+
+        for polygon in polygons:
+            # Exterior counter-clockwise, holes clockwise; drop closing points
+            polygon = orient(polygon, sign=1.0)
+            polygon_rings = [np.asarray(ring.coords)[:-1, :2] for ring in [polygon.exterior, *polygon.interiors]]
+            polygon_verts = np.concatenate(polygon_rings)
+            ring_ends = np.cumsum([len(ring) for ring in polygon_rings]).astype(np.uint32)
+
+            triangles = earcut.triangulate_float64(polygon_verts, ring_ends).reshape(-1, 3)
+            cap_faces.append(triangles + vertex_offset)
+
+            rings.extend(polygon_rings)
+            vertex_counts.append(len(polygon_verts))
+            vertex_offset += len(polygon_verts)
+
+        vertices_2d = np.concatenate(rings)
+        num_verts = len(vertices_2d)
+
+        vertices = np.empty((2 * num_verts, 3))
+        vertices[:num_verts, :2] = vertices_2d
+        vertices[num_verts:, :2] = vertices_2d
+        vertices[:num_verts, 2] = np.repeat(elevations, vertex_counts)
+        vertices[num_verts:, 2] = vertices[:num_verts, 2] + np.repeat(heights, vertex_counts)
+
+        # Wind every cap triangle counter-clockwise (seen from above) for the top
+        # cap; the bottom cap uses the reversed winding
+        caps = np.concatenate(cap_faces).astype(np.int64)
+        a, b, c = (vertices_2d[caps[:, k]] for k in range(3))
+        clockwise = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+        caps[clockwise] = caps[clockwise][:, ::-1]
+
+        # Side faces, two triangles per ring edge; each ring wraps to its own start
+        ring_lengths = np.array([len(ring) for ring in rings])
+        ring_ends = np.cumsum(ring_lengths)
+        j = np.arange(num_verts)
+        next_j = j + 1
+        next_j[ring_ends - 1] = ring_ends - ring_lengths
+        side_faces = np.empty((2 * num_verts, 3), dtype=np.int64)
+        side_faces[0::2] = np.column_stack([j, next_j, num_verts + next_j])
+        side_faces[1::2] = np.column_stack([j, num_verts + next_j, num_verts + j])
+
+        faces = np.concatenate([caps[:, ::-1], caps + num_verts, side_faces])
+        return vertices, faces
+
+    def _build_merged_meshes(self, apartment_data: Dict) -> List[Tuple[str, trimesh.Trimesh]]:
+        """
+        Build one mesh per entity type and subtype (and therefore per color),
+        so the GLB carries a handful of primitives instead of one per polygon
+        """
+        groups: Dict[Tuple[str, str], List[Dict]] = {}
+        for group_key, name_prefix in ENTITY_GROUPS:
+            for entity in apartment_data.get(group_key, []):
+                if not isinstance(entity['geometry'], Polygon) or entity['geometry'].is_empty:
                     continue
+                groups.setdefault((name_prefix, entity['entity_subtype']), []).append(entity)
 
-                color = self._get_color_for_entity(opening['entity_subtype'], opening['entity_type'])
-                mesh = self._extrude_polygon(
-                    opening['geometry'],
-                    opening['elevation'],
-                    opening['height'],
-                    color
-                )
+        merged_meshes = []
+        for (name_prefix, entity_subtype), entities in groups.items():
+            vertices, faces = self._extrude_polygons_batched(
+                [entity['geometry'] for entity in entities],
+                [entity['elevation'] for entity in entities],
+                [entity['height'] for entity in entities]
+            )
 
-                # Add metadata to mesh
-                mesh.metadata = {
-                    'entity_type': opening.get('entity_type', ''),
-                    'entity_subtype': opening.get('entity_subtype', ''),
-                    'roomtype': opening.get('roomtype', ''),
-                    'zoning': opening.get('zoning', ''),
-                    'elevation': opening.get('elevation', 0.0),
-                    'height': opening.get('height', 2.6),
-                    'area_id': opening.get('area_id'),
-                    'unit_id': opening.get('unit_id'),
-                    'coordinates': opening.get('coordinates', [])
-                }
-
-                # Create unique name
-                mesh_name = f"opening_{idx}_{opening.get('entity_subtype', 'unknown')}_{mesh_counter}"
-                scene.add_geometry(mesh, node_name=mesh_name, geom_name=mesh_name)
-                mesh_counter += 1
+            entity_type = entities[0]['entity_type']
+            mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
+            color = self._get_color_for_entity(entity_subtype, entity_type)
+            mesh.visual = TextureVisuals(material=self._material_for_color(color))
+            mesh.metadata = {
+                'entity_type': entity_type,
+                'entity_subtype': entity_subtype,
+                'count': len(entities),
+            }
+            merged_meshes.append((f"{name_prefix}_{entity_subtype}_merged", mesh))
+
+        return merged_meshes
+
+    def convert_apartment_to_glb(self, apartment_data: Dict, merge_meshes: bool = False) -> bytes:
+        """
+        Convert apartment data to GLB format
+
+        By default every room, wall, door and window is a separate selectable
+        mesh carrying its own metadata. With merge_meshes, entities of the same
+        type and subtype are combined into one mesh each, which gives a much
+        smaller GLB and fewer draw calls at the cost of per-entity selection.
+
+        Args:
+            apartment_data: Dictionary containing apartment data with areas, separators, openings
+            merge_meshes: Combine same-subtype meshes into one mesh per subtype
+
+        Returns:
+            GLB file as bytes
+        """
+        scene = trimesh.Scene()
+
+        try:
+            if merge_meshes:
+                named_meshes = self._build_merged_meshes(apartment_data)
+            else:
+                named_meshes = self._build_entity_meshes(apartment_data)
 
-            if mesh_counter == 0:
+            if not named_meshes:
                 raise ValueError("No valid meshes created from apartment data")
 
-            # Export scene to GLB (keeps meshes separate)
+            for mesh_name, mesh in named_meshes:
+                scene.add_geometry(mesh, node_name=mesh_name, geom_name=mesh_name)
+
+            # Export scene to GLB
             glb_bytes = scene.export(file_type='glb')
 
             if isinstance(glb_bytes, str):
                 glb_bytes = glb_bytes.encode()
 
-            logger.info(f"Generated GLB with {mesh_counter} separate meshes")
+            glb_bytes = self._optimize_glb(glb_bytes)
+
+            logger.info(f"Generated GLB with {len(named_meshes)} {'merged' if merge_meshes else 'separate'} meshes")
 
             return glb_bytes
 
@@ -0,0 +1,57 @@
+"""
+Convert the apartment CSV to Parquet or Feather for faster startup
+
+Usage (from the backend directory):
+    python convert_dataset.py [--format parquet|feather] [csv_file_path] [output_file_path]
+
+The API picks up the converted file automatically when it sits next to the CSV
+with the same base name (e.g. mds_V2_5.372k.parquet). Feather files are written
+uncompressed so they can be memory-mapped and shared between worker processes;
+Parquet files are zstd-compressed and smaller on disk.
+"""
+import argparse
+import os
+import logging
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from app.services.csv_extractor import (
+    DEFAULT_ELEVATION,
+    DEFAULT_HEIGHT,
+    dataset_path_for,
+    read_apartment_csv,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mds_V2_5.372k.csv")
+
+
+def convert(csv_file_path: str, output_file_path: str, file_format: str = 'parquet'):
+    """Read the needed CSV columns and write them as Parquet or Feather"""
+    logger.info(f"Reading CSV file from {csv_file_path}")
+    df = read_apartment_csv(csv_file_path)
+
+    # Apply the missing-value defaults up front so the loader has nothing to
+    # fill, keeping these columns zero-copy when a Feather file is memory-mapped
+    df['elevation'] = df['elevation'].fillna(DEFAULT_ELEVATION)
+    df['height'] = df['height'].fillna(DEFAULT_HEIGHT)
+
+    logger.info(f"Writing {len(df)} rows to {output_file_path}")
+    if file_format == 'feather':
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), output_file_path, compression='uncompressed')
+    else:
+        df.to_parquet(output_file_path, compression='zstd', row_group_size=64_000, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the apartment CSV to Parquet or Feather")
+    parser.add_argument('--format', choices=['parquet', 'feather'], default='parquet')
+    parser.add_argument('csv_file_path', nargs='?', default=DEFAULT_CSV_FILE_PATH)
+    parser.add_argument('output_file_path', nargs='?')
+    args = parser.parse_args()
+
+    output_file_path = args.output_file_path or dataset_path_for(args.csv_file_path, f".{args.format}")
+    convert(args.csv_file_path, output_file_path, args.format)
@@ -0,0 +1,55 @@
+import pytest
+import trimesh
+from shapely.geometry import Polygon
+
+from app.services.gltf_converter import PolygonToGLTFConverter
+
+# Concave L-shaped room
+L_SHAPE = Polygon([(0, 0), (4, 0), (4, 1), (1, 1), (1, 3), (0, 3)])
+
+# Room with a square hole (e.g. a shaft)
+WITH_HOLE = Polygon(
+    [(10, 0), (16, 0), (16, 5), (10, 5)],
+    [[(12, 2), (14, 2), (14, 3), (12, 3)]],
+)
+
+# Clockwise exterior and counter-clockwise hole (reversed from shapely's canonical orientation)
+MIXED_ORIENTATION = Polygon(
+    [(20, 0), (20, 4), (25, 4), (25, 0)],
+    [[(21, 1), (23, 1), (23, 2), (21, 2)]],
+)
+
+
+@pytest.fixture
+def converter():
+    return PolygonToGLTFConverter()
+
+
+@pytest.mark.parametrize("polygons", [
+    [L_SHAPE],
+    [WITH_HOLE],
+    [MIXED_ORIENTATION],
+    [L_SHAPE, WITH_HOLE, MIXED_ORIENTATION],
+])
+def test_extrude_polygons_batched_matches_per_polygon_extrusion(converter, polygons):
+    elevations = [0.5 * i for i in range(len(polygons))]
+    heights = [2.6 + i for i in range(len(polygons))]
+
+    vertices, faces = converter._extrude_polygons_batched(polygons, elevations, heights)
+    mesh = trimesh.Trimesh(vertices=vertices, faces=faces)
+
+    expected_volume = sum(
+        trimesh.creation.extrude_polygon(polygon, height).volume
+        for polygon, height in zip(polygons, heights)
+    )
+
+    assert mesh.is_watertight
+    assert mesh.is_winding_consistent
+    assert mesh.volume == pytest.approx(expected_volume)
+
+
+def test_extrude_polygons_batched_applies_elevation_and_height(converter):
+    vertices, _ = converter._extrude_polygons_batched([L_SHAPE], [1.0], [2.5])
+
+    assert vertices[:, 2].min() == pytest.approx(1.0)
+    assert vertices[:, 2].max() == pytest.approx(3.5)